@@ -0,0 +1,136 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Copyright 2020, CCL Forensics
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Compiled version of ccl_simplesnappy.decompress, used by that module when built (cythonize -i ccl/_snappy.pyx).
+# Indexing is unchecked, so every read and backreference is bounds checked explicitly.
+
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+from libc.string cimport memcpy
+
+
+cpdef bytes decompress(const unsigned char[::1] data):
+    """Decompresses the snappy compressed data"""
+    cdef Py_ssize_t data_length = data.shape[0]
+    cdef Py_ssize_t pos = 0
+    cdef Py_ssize_t out_pos = 0
+    cdef Py_ssize_t uncompressed_length = 0
+    cdef Py_ssize_t length, offset, extra, i, chunk
+    cdef unsigned int shift = 0
+    cdef unsigned char type_byte, tag
+    cdef char *op
+    cdef char *src
+    cdef char *dst
+    cdef bytes out
+
+    # length header: a varint of at most 10 bytes, as read by ccl_simplesnappy._read_le_varint
+    for i in range(10):
+        if pos >= data_length:
+            raise ValueError("Wrong data length in uncompressed data")
+        type_byte = data[pos]
+        pos += 1
+        if shift < 56:
+            uncompressed_length |= <Py_ssize_t>(type_byte & 0x7f) << shift
+        elif type_byte & 0x7f:  # at least 2**56, more than any input could decompress to
+            raise ValueError("Wrong data length in uncompressed data")
+        if type_byte < 0x80:
+            break
+        shift += 7
+
+    # reject corrupt lengths before allocating (see ccl_simplesnappy.max_uncompressed_length)
+    if uncompressed_length > (data_length - pos + 2) // 3 * 64:
+        raise ValueError("Wrong data length in uncompressed data")
+
+    out = PyBytes_FromStringAndSize(NULL, uncompressed_length)
+    op = PyBytes_AS_STRING(out)
+
+    while pos < data_length:
+        type_byte = data[pos]
+        pos += 1
+        tag = type_byte & 0x03
+
+        if tag == 0:  # literal
+            length = type_byte >> 2
+            if length >= 60:  # length is in the following 1-4 bytes
+                extra = length - 59
+                if pos + extra > data_length:
+                    raise ValueError("Couldn't read enough literal data")
+                length = 0
+                for i in range(extra):
+                    length |= <Py_ssize_t>data[pos + i] << (8 * i)
+                pos += extra
+            length += 1
+
+            if pos + length > data_length:
+                raise ValueError("Couldn't read enough literal data")
+            if out_pos + length > uncompressed_length:
+                raise ValueError("Wrong data length in uncompressed data")
+
+            memcpy(op + out_pos, &data[pos], length)
+            pos += length
+            out_pos += length
+
+        else:
+            if tag == 1:
+                if pos + 1 > data_length:
+                    raise ValueError("Couldn't read backreference offset")
+                length = ((type_byte & 0x1C) >> 2) + 4
+                offset = ((type_byte & 0xE0) << 3) | data[pos]
+                pos += 1
+            else:
+                extra = 2 if tag == 2 else 4
+                if pos + extra > data_length:
+                    raise ValueError("Couldn't read backreference offset")
+                length = 1 + (type_byte >> 2)
+                offset = 0
+                for i in range(extra):
+                    offset |= <Py_ssize_t>data[pos + i] << (8 * i)
+                pos += extra
+
+            if offset == 0:
+                raise ValueError("Offset cannot be 0")
+            if offset > out_pos:
+                raise ValueError("Backreference offset is before the start of the data")
+            if out_pos + length > uncompressed_length:
+                raise ValueError("Wrong data length in uncompressed data")
+
+            src = op + out_pos - offset
+            dst = op + out_pos
+            out_pos += length
+            if offset >= length:
+                memcpy(dst, src, length)
+            elif offset >= 8:
+                # overlapping, but each 8 byte chunk only reads data that has already been written
+                while length > 0:
+                    chunk = 8 if length > 8 else length
+                    memcpy(dst, src, chunk)
+                    dst += chunk
+                    src += chunk
+                    length -= chunk
+            else:
+                for i in range(length):
+                    dst[i] = src[i]
+
+    if out_pos != uncompressed_length:
+        raise ValueError("Wrong data length in uncompressed data")
+
+    return out
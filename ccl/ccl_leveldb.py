@@ -43,21 +43,27 @@ def _read_le_varint(stream: BinaryIO, *, is_google_32bit=False) -> Optional[Tupl
     otherwise returns None.
     Can be switched to limit the varint to 32 bit."""
     # this only outputs unsigned
-    i = 0
-    result = 0
-    underlying_bytes = []
+    raw = stream.read(1)
+    if not raw:
+        return None
+    if raw[0] < 0x80:  # most varints are a single byte
+        return raw[0], raw
+
+    # longer varints: the raw bytes are accumulated by concatenation, which is cheaper in CPython than
+    # collecting the ints in a list (or a preallocated bytearray) and converting them at the end
+    result = raw[0] & 0x7f
+    underlying_bytes = raw
     limit = 5 if is_google_32bit else 10
-    while i < limit:
+    for i in range(1, limit):
         raw = stream.read(1)
-        if len(raw) < 1:
+        if not raw:
             return None
-        tmp, = raw
-        underlying_bytes.append(tmp)
+        tmp = raw[0]
+        underlying_bytes += raw
         result |= ((tmp & 0x7f) << (i * 7))
-        if (tmp & 0x80) == 0:
+        if tmp < 0x80:
             break
-        i += 1
-    return result, bytes(underlying_bytes)
+    return result, underlying_bytes
 
 
 def read_le_varint(stream: BinaryIO, *, is_google_32bit=False) -> Optional[int]:
@@ -20,17 +20,39 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from struct import unpack
-from io import BytesIO
-from typing import BinaryIO, Optional, Tuple
+import os
+import sys
+from struct import Struct
+from typing import BinaryIO, Iterator, Optional, Tuple
 from enum import IntEnum
 
+# the numba compiled versions are opt in (CCL_USE_NUMBA=1 in the environment) as importing numba and compiling
+# them is far slower than importing this module
+numba = None
+if os.environ.get("CCL_USE_NUMBA") == "1":
+    try:
+        import numba
+        import numpy
+    except ImportError:
+        numba = None
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+try:
+    from . import _snappy  # compiled from _snappy.pyx, if it has been built
+except ImportError:
+    _snappy = None
+
 __version__ = "0.4"
 __description__ = "Pure Python reimplementation of Google's Snappy decompression"
 __contact__ = "Alex Caithness"
 
 
 DEBUG = False
+UINT32 = Struct("<I")
 FRAME_MAGIC = bytes.fromhex("73 4E 61 50 70 59")
 
 
@@ -48,14 +70,48 @@ def make_crc_table(poly):
     return table
 
 
+def make_slice_table(table, n):
+    """Derives the table for byte n of a "slice-by-N" CRC from the basic (byte-at-a-time) table"""
+    result = list(table)
+    for _ in range(n):
+        result = [(crc >> 8) ^ table[crc & 0xff] for crc in result]
+    return result
+
+
 CRC_POLY = 0x82F63B78
 CRC_QUICK_TABLE = tuple(make_crc_table(CRC_POLY))
+CRC_SLICE_TABLES = tuple(tuple(make_slice_table(CRC_QUICK_TABLE, n)) for n in range(8))
 
 
-def crc32c(data, xor_value=0xffffffff):
+def _crc32c_py(data, xor_value=0xffffffff):
+    """Reference (pure Python) CRC-32C implementation, used when no native implementation is available"""
     value = 0xffffffff
-    for b in data:
-        value = CRC_QUICK_TABLE[(b ^ value) & 0xff] ^ (value >> 8)
+
+    # below 16 bytes setting up the tables and words costs more than it saves, so short data goes byte-at-a-time
+    if len(data) < 16:
+        table = CRC_QUICK_TABLE
+        for b in data:
+            value = table[(b ^ value) & 0xff] ^ (value >> 8)
+        return value ^ xor_value
+
+    # slice-by-8: fold 8 bytes into the crc per iteration, reading the body as little-endian uint64 words.
+    t0, t1, t2, t3, t4, t5, t6, t7 = CRC_SLICE_TABLES
+    body_length = len(data) & ~7
+    if sys.byteorder == "little":
+        try:
+            words = memoryview(data)[:body_length].cast("Q")
+        except TypeError:  # not bytes-like (e.g. a list of ints), so leave it all to the byte loop
+            words = ()
+            body_length = 0
+    else:
+        words = (int.from_bytes(data[i:i + 8], "little") for i in range(0, body_length, 8))
+    for w in words:
+        w ^= value
+        value = (t7[w & 0xff] ^ t6[(w >> 8) & 0xff] ^ t5[(w >> 16) & 0xff] ^ t4[(w >> 24) & 0xff] ^
+                 t3[(w >> 32) & 0xff] ^ t2[(w >> 40) & 0xff] ^ t1[(w >> 48) & 0xff] ^ t0[w >> 56])
+
+    for b in data[body_length:]:
+        value = t0[(b ^ value) & 0xff] ^ (value >> 8)
 
     value ^= xor_value
     return value
@@ -78,25 +134,33 @@ class ElementType(IntEnum):
     CopyFourByte = 3
 
 
+# literal length code (upper 6 bits of the tag byte) -> (count of following length bytes, length if embedded)
+LITERAL_LENGTH_DISPATCH = tuple([(0, code + 1) for code in range(60)] + [(1, 0), (2, 0), (3, 0), (4, 0)])
+
+
 def _read_le_varint(stream: BinaryIO) -> Optional[Tuple[int, bytes]]:
     """Read varint from a stream.
     If the read is successful: returns a tuple of the (unsigned) value and the raw bytes making up that varint,
     otherwise returns None"""
     # this only outputs unsigned
-    i = 0
-    result = 0
-    underlying_bytes = []
-    while i < 10:  # 64 bit max possible?
+    raw = stream.read(1)
+    if not raw:
+        return None
+    if raw[0] < 0x80:  # most varints are a single byte
+        return raw[0], raw
+
+    result = raw[0] & 0x7f
+    underlying_bytes = raw
+    for i in range(1, 10):  # 64 bit max possible?
         raw = stream.read(1)
-        if len(raw) < 1:
+        if not raw:
             return None
-        tmp, = raw
-        underlying_bytes.append(tmp)
+        tmp = raw[0]
+        underlying_bytes += raw
         result |= ((tmp & 0x7f) << (i * 7))
-        if (tmp & 0x80) == 0:
+        if tmp < 0x80:
             break
-        i += 1
-    return result, bytes(underlying_bytes)
+    return result, underlying_bytes
 
 
 def read_le_varint(stream: BinaryIO) -> Optional[int]:
@@ -108,19 +172,26 @@ def read_le_varint(stream: BinaryIO) -> Optional[int]:
         return x[0]
 
 
+def max_uncompressed_length(compressed_length: int) -> int:
+    """Upper bound for the data that compressed_length bytes of snappy elements can decompress to
+    (the most any element produces is 64 bytes from a 3 byte copy). Used to reject corrupt length headers
+    before allocating the output."""
+    return (compressed_length + 2) // 3 * 64
+
+
 def read_uint16(stream: BinaryIO) -> int:
     """Reads an Uint16 from stream"""
-    return unpack("<H", stream.read(2))[0]
+    return int.from_bytes(stream.read(2), "little")
 
 
 def read_uint24(stream: BinaryIO) -> int:
     """Reads an Uint24 from stream"""
-    return unpack("<I", stream.read(3) + b"\x00")[0]
+    return int.from_bytes(stream.read(3), "little")
 
 
 def read_uint32(stream: BinaryIO) -> int:
     """Reads an Uint32 from stream"""
-    return unpack("<I", stream.read(4))[0]
+    return int.from_bytes(stream.read(4), "little")
 
 
 def read_byte(stream: BinaryIO) -> Optional[int]:
@@ -132,99 +203,118 @@ def read_byte(stream: BinaryIO) -> Optional[int]:
     return None
 
 
-def decompress(data: BinaryIO) -> bytes:
-    """Decompresses the snappy compressed data stream"""
+def _decompress_py(data: BinaryIO) -> bytes:
+    """Decompresses the snappy compressed data stream (pure Python implementation)"""
     uncompressed_length = read_le_varint(data)
     # log(f"Uncompressed length: {uncompressed_length}")
 
-    out = BytesIO()
-
-    while True:
-        start_offset = data.tell()
-        # log(f"Reading tag at offset {start_offset}")
-        type_byte = read_byte(data)
-        if type_byte is None:
-            break
+    # the rest of the stream is read in one go and walked with an index (pos) rather than making a read
+    # call per element; the output is allocated up front and filled in from out_pos
+    compressed = data.read()
+    if uncompressed_length is None or uncompressed_length > max_uncompressed_length(len(compressed)):
+        raise ValueError("Wrong data length in uncompressed data")
+    # module level names used in the loop are bound locally (local lookups are much cheaper than global ones)
+    literal_length_dispatch = LITERAL_LENGTH_DISPATCH
+    unpack_uint32 = UINT32.unpack_from
+    compressed_view = memoryview(compressed)
+    compressed_length = len(compressed)
+    pos = 0
+    out = bytearray(uncompressed_length)
+    out_pos = 0
+
+    while pos < compressed_length:
+        # log(f"Reading tag at offset {pos}")
+        type_byte = compressed[pos]
+        pos += 1
 
         # log(f"Type Byte is {type_byte:02x}")
 
+        # tags are compared as plain ints (see ElementType) as IntEnum comparisons are slow in this loop
         tag = type_byte & 0x03
+        length_code = type_byte >> 2
 
         # log(f"Element Type is: {ElementType(tag)}")
 
-        if tag == ElementType.Literal:
-            if ((type_byte & 0xFC) >> 2) < 60:  # embedded in tag
-                length = 1 + ((type_byte & 0xFC) >> 2)
-                # log(f"Literal length is embedded in type byte and is {length}")
-            elif ((type_byte & 0xFC) >> 2) == 60:  # 8 bit
-                length = 1 + read_byte(data)
-                # log(f"Literal length is 8bit and is {length}")
-            elif ((type_byte & 0xFC) >> 2) == 61:  # 16 bit
-                length = 1 + read_uint16(data)
-                # log(f"Literal length is 16bit and is {length}")
-            elif ((type_byte & 0xFC) >> 2) == 62:  # 16 bit
-                length = 1 + read_uint24(data)
-                # log(f"Literal length is 24bit and is {length}")
-            elif ((type_byte & 0xFC) >> 2) == 63:  # 16 bit
-                length = 1 + read_uint32(data)
-                # log(f"Literal length is 32bit and is {length}")
-            else:
-                raise ValueError()  # cannot ever happen
+        if tag == 0:  # ElementType.Literal
+            extra, length = literal_length_dispatch[length_code]
+            if extra:
+                if pos + extra > compressed_length:
+                    raise ValueError("Couldn't read enough literal data")
+                length = 1 + int.from_bytes(compressed[pos: pos + extra], "little")
+                pos += extra
+            # log(f"Literal length is {length}")
 
-            literal_data = data.read(length)
-            if len(literal_data) < length:
+            if pos + length > compressed_length:
                 raise ValueError("Couldn't read enough literal data")
+            if out_pos + length > uncompressed_length:
+                raise ValueError("Wrong data length in uncompressed data")
 
-            out.write(literal_data)
+            out[out_pos: out_pos + length] = compressed_view[pos: pos + length]
+            pos += length
+            out_pos += length
 
         else:
-            if tag == ElementType.CopyOneByte:
-                length = ((type_byte & 0x1C) >> 2) + 4
-                offset = ((type_byte & 0xE0) << 3) | read_byte(data)
-            elif tag == ElementType.CopyTwoByte:
-                length = 1 + ((type_byte & 0xFC) >> 2)
-                offset = read_uint16(data)
-            elif tag == ElementType.CopyFourByte:
-                length = 1 + ((type_byte & 0xFC) >> 2)
-                offset = read_uint32(data)
+            if tag == 1:  # ElementType.CopyOneByte
+                if pos + 1 > compressed_length:
+                    raise ValueError("Couldn't read backreference offset")
+                length = (length_code & 0x07) + 4
+                offset = ((type_byte & 0xE0) << 3) | compressed[pos]
+                pos += 1
+            elif tag == 2:  # ElementType.CopyTwoByte
+                if pos + 2 > compressed_length:
+                    raise ValueError("Couldn't read backreference offset")
+                length = 1 + length_code
+                offset = compressed[pos] | (compressed[pos + 1] << 8)
+                pos += 2
+            elif tag == 3:  # ElementType.CopyFourByte
+                if pos + 4 > compressed_length:
+                    raise ValueError("Couldn't read backreference offset")
+                length = 1 + length_code
+                offset, = unpack_uint32(compressed, pos)
+                pos += 4
             else:
                 raise ValueError()  # cannot ever happen
 
             if offset == 0:
                 raise ValueError("Offset cannot be 0")
 
-            actual_offset = out.tell() - offset
-            # log(f"Current Outstream Length: {out.tell()}")
+            if offset > out_pos:
+                raise ValueError("Backreference offset is before the start of the data")
+            if out_pos + length > uncompressed_length:
+                raise ValueError("Wrong data length in uncompressed data")
+
+            actual_offset = out_pos - offset
+            # log(f"Current Outstream Length: {out_pos}")
             # log(f"Backreference length: {length}")
             # log(f"Backreference relative offset: {offset}")
             # log(f"Backreference absolute offset: {actual_offset}")
 
             # have to read incrementally because you might have to read data that you've just written
             # for i in range(length):
-            #     out.write(out.getbuffer()[actual_offset + i: actual_offset + i + 1].tobytes())
-            buffer = out.getbuffer()[actual_offset: actual_offset + length].tobytes()
-            if offset - length <= 0:
-                # better safe than sorry, this way we're sure to extend it
-                # as much as needed without doing some extra calculations
-                buffer = (buffer * length)[:length]
-            out.write(buffer)
-
-    result = out.getvalue()
-    if uncompressed_length != len(result):
+            #     out[out_pos + i] = out[actual_offset + i]
+            # unless the run overlaps the end of the output, where the available data is repeated to fill it
+            if offset >= length:
+                out[out_pos: out_pos + length] = out[actual_offset: actual_offset + length]
+            elif offset == 1:  # run of a single byte
+                out[out_pos: out_pos + length] = out[actual_offset: out_pos] * length
+            else:
+                buffer = out[actual_offset: out_pos]
+                repeats, remainder = divmod(length, offset)
+                out[out_pos: out_pos + length] = buffer * repeats + buffer[:remainder]
+            out_pos += length
+
+    if uncompressed_length != out_pos:
         raise ValueError("Wrong data length in uncompressed data")
         # TODO: allow a partial / potentially bad result via a flag in the function call?
 
-    return result
+    return bytes(out)
 
 
 def check_masked_crc(crc, data, xor_value=0xffffffff):
-    check = crc32c(data, xor_value=xor_value)
-
-    check = ((check >> 15) | (check << 17)) & 0xffffffff  # rotate
-    check += 0xa282ead8  # add constant
-    check %= 0x100000000  # wraparound as an uint32
+    check = crc32c(data, xor_value)
 
-    return crc == check
+    # rotate right by 15, add constant, wraparound as an uint32
+    return crc == ((((check >> 15) | (check << 17)) & 0xffffffff) + 0xa282ead8) & 0xffffffff
 
 
 def read_frame(frame_stream: BinaryIO):
@@ -235,7 +325,7 @@ def read_frame(frame_stream: BinaryIO):
         raise ValueError("Could not read entire frame header")
 
     frame_id = frame_header[0]
-    frame_length, = unpack("<I", frame_header[1:] + b"\x00")
+    frame_length = UINT32.unpack(frame_header)[0] >> 8  # 24 bit length after the id byte
 
     data = frame_stream.read(frame_length)
     if len(data) != frame_length:
@@ -243,3 +333,159 @@ def read_frame(frame_stream: BinaryIO):
 
     return frame_id, data
 
+
+def iter_frames(frame_stream: BinaryIO) -> Iterator[Tuple[int, memoryview]]:
+    """Reads every frame from the stream, yielding (frame id, frame data) tuples.
+    The stream is read in one go and the frame data is returned as memoryview slices of it (no copy per frame).
+    Note that the google-crc32c backed crc32c only accepts bytes, so it still copies each frame it checks."""
+    buffer = memoryview(frame_stream.read())
+    buffer_length = len(buffer)
+    pos = 0
+    while pos < buffer_length:
+        if pos + 4 > buffer_length:
+            raise ValueError("Could not read entire frame header")
+
+        frame_id = buffer[pos]
+        frame_length = UINT32.unpack_from(buffer, pos)[0] >> 8  # 24 bit length after the id byte
+        pos += 4
+
+        data = buffer[pos: pos + frame_length]
+        if len(data) != frame_length:
+            raise ValueError(f"Could not read all data; wanted: {frame_length}; got: {len(data)}")
+        pos += frame_length
+
+        yield frame_id, data
+
+
+if numba is not None:
+    SNAPPY_NB_ERRORS = {
+        -1: "Couldn't read enough literal data",
+        -2: "Couldn't read backreference offset",
+        -3: "Offset cannot be 0",
+        -4: "Backreference offset is before the start of the data",
+        -5: "Wrong data length in uncompressed data",
+    }
+
+    _CRC_QUICK_TABLE_NP = numpy.array(CRC_QUICK_TABLE, dtype=numpy.uint32)
+
+    @numba.njit(cache=True)
+    def _crc32c_nb(data, xor_value):
+        table = _CRC_QUICK_TABLE_NP
+        value = numpy.uint32(0xffffffff)
+        for b in data:
+            value = table[(b ^ value) & 0xff] ^ (value >> 8)
+
+        return value ^ xor_value
+
+    @numba.njit(cache=True)
+    def _snappy_decompress_nb(data, out):
+        """Decompresses the snappy elements in data into out, returning the length written
+        or a negative error code (see SNAPPY_NB_ERRORS)"""
+        data_length = len(data)
+        out_length = len(out)
+        pos = 0
+        out_pos = 0
+
+        while pos < data_length:
+            type_byte = numpy.int64(data[pos])
+            pos += 1
+            tag = type_byte & 0x03
+
+            if tag == 0:  # literal
+                length = type_byte >> 2
+                if length >= 60:  # length is in the following 1-4 bytes
+                    extra = length - 59
+                    if pos + extra > data_length:
+                        return -1
+                    length = 0
+                    for i in range(extra):
+                        length |= numpy.int64(data[pos + i]) << (8 * i)
+                    pos += extra
+                length += 1
+
+                if pos + length > data_length:
+                    return -1
+                if out_pos + length > out_length:
+                    return -5
+
+                out[out_pos: out_pos + length] = data[pos: pos + length]
+                pos += length
+                out_pos += length
+
+            else:
+                if tag == 1:
+                    if pos + 1 > data_length:
+                        return -2
+                    length = ((type_byte & 0x1C) >> 2) + 4
+                    offset = ((type_byte & 0xE0) << 3) | numpy.int64(data[pos])
+                    pos += 1
+                else:
+                    offset_size = 2 if tag == 2 else 4
+                    if pos + offset_size > data_length:
+                        return -2
+                    length = 1 + (type_byte >> 2)
+                    offset = 0
+                    for i in range(offset_size):
+                        offset |= numpy.int64(data[pos + i]) << (8 * i)
+                    pos += offset_size
+
+                if offset == 0:
+                    return -3
+                if offset > out_pos:
+                    return -4
+                if out_pos + length > out_length:
+                    return -5
+
+                # byte by byte as the source may overlap the data being written
+                for i in range(length):
+                    out[out_pos + i] = out[out_pos - offset + i]
+                out_pos += length
+
+        return out_pos
+
+    def _crc32c_numba(data, xor_value=0xffffffff):
+        """CRC-32C using the numba compiled loop"""
+        return int(_crc32c_nb(numpy.frombuffer(data, dtype=numpy.uint8), numpy.uint32(xor_value)))
+
+    def _decompress_numba(data: BinaryIO) -> bytes:
+        """Decompresses the snappy compressed data stream using the numba compiled loop"""
+        uncompressed_length = read_le_varint(data)
+        compressed = data.read()
+        if uncompressed_length is None or uncompressed_length > max_uncompressed_length(len(compressed)):
+            raise ValueError("Wrong data length in uncompressed data")
+
+        out = numpy.empty(uncompressed_length, dtype=numpy.uint8)
+        result = _snappy_decompress_nb(numpy.frombuffer(compressed, dtype=numpy.uint8), out)
+        if result < 0:
+            raise ValueError(SNAPPY_NB_ERRORS[result])
+        if result != uncompressed_length:
+            raise ValueError("Wrong data length in uncompressed data")
+
+        return out.tobytes()
+
+    crc32c = _crc32c_numba
+    decompress = _decompress_numba
+
+else:
+    crc32c = _crc32c_py
+    decompress = _decompress_py
+
+if _snappy is not None:
+    def _decompress_cython(data: BinaryIO) -> bytes:
+        """Decompresses the snappy compressed data stream using the compiled extension"""
+        return _snappy.decompress(data.read())
+
+    decompress = _decompress_cython
+
+if google_crc32c is not None and google_crc32c.implementation == "c":
+    def _crc32c_google(data, xor_value=0xffffffff):
+        """CRC-32C using the google-crc32c native library (which already applies the final xor)"""
+        if type(data) is not bytes:
+            data = bytes(data)  # the library only accepts bytes
+        return google_crc32c.value(data) ^ (xor_value ^ 0xffffffff)
+
+    crc32c = _crc32c_google
+
+# setting CCL_FORCE_PYCRC=1 in the environment forces the pure Python CRC (e.g. to test it against the others)
+if os.environ.get("CCL_FORCE_PYCRC") == "1":
+    crc32c = _crc32c_py
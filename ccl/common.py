@@ -6,14 +6,57 @@ from collections.abc import Collection, Callable
 KeySearch = Union[str, Pattern, Collection[str], Callable[[str], bool]]
 
 
-def is_keysearch_hit(search: KeySearch, value: str):
+def compile_keysearch(search: KeySearch) -> KeySearch:
+    """
+    Prepares a KeySearch to be tested against many values with is_keysearch_hit: collections of strings
+    (other than sets) are converted to a frozenset so that each test is a hash lookup rather than a scan.
+    Callables are returned unchanged even if they are also collections, as is_keysearch_hit calls them.
+    :param search: the KeySearch to prepare
+    :return: an equivalent KeySearch
+    """
+    if isinstance(search, (str, set, frozenset)) or callable(search):
+        return search
+    elif isinstance(search, Collection):
+        return frozenset(search)
+    return search
+
+
+def make_matcher(search: KeySearch) -> Callable[[str], bool]:
+    """
+    Builds a function testing values against a KeySearch, with the type dispatch done once up front: use this
+    rather than is_keysearch_hit when testing many values against the same search.
+    :param search: the KeySearch to test values against
+    :return: a function taking a value and returning True if it is a hit
+    """
     if isinstance(search, str):
+        return lambda value: value == search
+    elif isinstance(search, Pattern):
+        pattern_search = search.search
+        return lambda value: pattern_search(value) is not None
+    elif isinstance(search, (set, frozenset)):
+        return search.__contains__
+    elif callable(search):
+        return search
+    elif isinstance(search, Collection):
+        return compile_keysearch(search).__contains__
+    else:
+        raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
+
+
+def is_keysearch_hit(search: KeySearch, value: str):
+    # exact type checks first for the common cases as they skip the (slow) ABC isinstance machinery
+    search_type = type(search)
+    if search_type is str:
         return value == search
+    elif search_type is frozenset or search_type is set:
+        return value in search
     elif isinstance(search, Pattern):
         return search.search(value) is not None
-    elif isinstance(search, Collection):
-        return value in set(search)
-    elif isinstance(search, Callable):
+    elif callable(search):
         return search(value)
+    elif isinstance(search, str):  # str subclasses
+        return value == search
+    elif isinstance(search, Collection):
+        return value in search  # pass the search through compile_keysearch first to avoid scanning it each time
     else:
-        raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
\ No newline at end of file
+        raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
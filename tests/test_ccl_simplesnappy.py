@@ -0,0 +1,220 @@
+"""
+Checks that every available CRC32C and snappy decompression implementation in ccl_simplesnappy agrees with a
+reference, including on truncated and corrupt snappy data, and that iter_frames reads the same frames as read_frame.
+
+Run from the repository root: python -m unittest discover tests
+The numba versions are included when numba is installed (they are switched on with CCL_USE_NUMBA=1 for the
+duration of these tests; set CCL_USE_NUMBA=0 to skip them) and the Cython version when ccl/_snappy.pyx has been
+built.
+"""
+
+import importlib
+import os
+import random
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from ccl import ccl_simplesnappy
+
+CRC_NAMES = ("_crc32c_py", "_crc32c_numba", "_crc32c_google")
+DECOMPRESS_NAMES = ("_decompress_py", "_decompress_numba", "_decompress_cython")
+
+
+def setUpModule():
+    # the numba versions are only defined when CCL_USE_NUMBA=1 at import, so reload the module with it set
+    with mock.patch.dict(os.environ, {"CCL_USE_NUMBA": os.environ.get("CCL_USE_NUMBA", "1")}):
+        importlib.reload(ccl_simplesnappy)
+
+
+def tearDownModule():
+    importlib.reload(ccl_simplesnappy)
+
+
+def available(names):
+    return [getattr(ccl_simplesnappy, name) for name in names if hasattr(ccl_simplesnappy, name)]
+
+
+def reference_crc32c(data, xor_value=0xffffffff):
+    """Bit at a time CRC-32C"""
+    crc = 0xffffffff
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ (ccl_simplesnappy.CRC_POLY if crc & 1 else 0)
+    return crc ^ xor_value
+
+
+def encode_varint(value):
+    result = bytearray()
+    while value >= 0x80:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def make_snappy(rng: random.Random, element_count: int):
+    """Builds a random snappy stream using every element type, returning (compressed, uncompressed)"""
+    out = bytearray()
+    elements = bytearray()
+    for _ in range(element_count):
+        if not out or rng.random() < 0.3:
+            literal = bytes(rng.choice(b"abcd\x00\xff") for _ in range(rng.choice((1, 5, 60, 61, 300))))
+            length_code = len(literal) - 1
+            if length_code < 60:
+                elements.append(length_code << 2)
+            else:
+                extra = 1 if length_code < 0x100 else 2
+                elements.append((59 + extra) << 2)
+                elements += length_code.to_bytes(extra, "little")
+            elements += literal
+            out += literal
+        else:
+            offset = rng.randint(1, min(len(out), 2047))
+            tag = rng.choice((1, 2, 3))
+            if tag == 1:
+                length = rng.randint(4, 11)
+                elements.append(((offset >> 8) << 5) | ((length - 4) << 2) | 1)
+                elements.append(offset & 0xff)
+            else:
+                length = rng.randint(1, 64)
+                elements.append(((length - 1) << 2) | tag)
+                elements += offset.to_bytes(2 if tag == 2 else 4, "little")
+            for _ in range(length):
+                out.append(out[-offset])
+
+    return encode_varint(len(out)) + bytes(elements), bytes(out)
+
+
+def run_decompress(implementation, compressed):
+    try:
+        return implementation(BytesIO(compressed))
+    except ValueError:
+        return ValueError
+
+
+def make_frame(frame_id, data):
+    return bytes([frame_id]) + len(data).to_bytes(3, "little") + data
+
+
+def read_all_frames(frame_stream):
+    """Reads frames with read_frame until the stream runs out"""
+    frames = []
+    while True:
+        try:
+            frames.append(ccl_simplesnappy.read_frame(frame_stream))
+        except ccl_simplesnappy.NoMoreData:
+            return frames
+
+
+class TestCrc32c(unittest.TestCase):
+    def test_check_value(self):
+        for implementation in available(CRC_NAMES):
+            with self.subTest(implementation=implementation.__name__):
+                self.assertEqual(implementation(b"123456789"), 0xe3069283)
+
+    def test_matches_reference(self):
+        rng = random.Random(1)
+        for length in (0, 1, 7, 8, 15, 16, 17, 100, 1023, 4099):
+            data = bytes(rng.getrandbits(8) for _ in range(length))
+            for xor_value in (0xffffffff, 0):
+                expected = reference_crc32c(data, xor_value)
+                for implementation in available(CRC_NAMES):
+                    for buffer in (data, bytearray(data), memoryview(data), memoryview(b"x" + data)[1:]):
+                        with self.subTest(implementation=implementation.__name__, length=length,
+                                          xor_value=xor_value, buffer=type(buffer).__name__):
+                            self.assertEqual(implementation(buffer, xor_value), expected)
+
+    def test_python_accepts_int_sequences(self):
+        # like the original byte loop, the pure Python version takes any sequence of byte values
+        rng = random.Random(2)
+        for length in (0, 7, 16, 100):
+            data = [rng.getrandbits(8) for _ in range(length)]
+            with self.subTest(length=length):
+                self.assertEqual(ccl_simplesnappy._crc32c_py(data), reference_crc32c(data))
+
+    def test_check_masked_crc(self):
+        data = b"snappy frame payload"
+        crc = reference_crc32c(data)
+        masked = ((((crc >> 15) | (crc << 17)) & 0xffffffff) + 0xa282ead8) & 0xffffffff
+        self.assertTrue(ccl_simplesnappy.check_masked_crc(masked, data))
+        self.assertFalse(ccl_simplesnappy.check_masked_crc(masked ^ 1, data))
+
+
+class TestDecompress(unittest.TestCase):
+    def test_valid_streams(self):
+        rng = random.Random(2)
+        for i in range(200):
+            compressed, expected = make_snappy(rng, rng.randint(1, 40))
+            for implementation in available(DECOMPRESS_NAMES):
+                with self.subTest(implementation=implementation.__name__, stream=i):
+                    self.assertEqual(implementation(BytesIO(compressed)), expected)
+
+    def test_corrupt_streams(self):
+        rng = random.Random(3)
+        for i in range(300):
+            compressed, _ = make_snappy(rng, rng.randint(1, 20))
+            corrupt = bytearray(compressed)
+            if rng.random() < 0.5:
+                del corrupt[rng.randrange(len(corrupt)):]
+            for _ in range(rng.randint(0, 3)):
+                if corrupt:
+                    corrupt[rng.randrange(len(corrupt))] = rng.getrandbits(8)
+            corrupt = bytes(corrupt)
+
+            # the pure Python version is the reference; any result other than ValueError must match it
+            expected = run_decompress(ccl_simplesnappy._decompress_py, corrupt)
+            for implementation in available(DECOMPRESS_NAMES):
+                with self.subTest(implementation=implementation.__name__, stream=i):
+                    self.assertEqual(run_decompress(implementation, corrupt), expected)
+
+    def test_bad_length_headers(self):
+        for header in (b"", b"\x80", b"\xff" * 9 + b"\x01", encode_varint(2 ** 50), encode_varint(1000)):
+            for implementation in available(DECOMPRESS_NAMES):
+                with self.subTest(implementation=implementation.__name__, header=header):
+                    with self.assertRaises(ValueError):
+                        implementation(BytesIO(header + b"\x00a"))
+
+    def test_ten_byte_length_header(self):
+        for implementation in available(DECOMPRESS_NAMES):
+            with self.subTest(implementation=implementation.__name__):
+                self.assertEqual(implementation(BytesIO(b"\x81" + b"\x80" * 8 + b"\x00" + b"\x00a")), b"a")
+
+
+class TestFrames(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        compressed, _ = make_snappy(rng, 20)
+        self.stream = b"".join((
+            make_frame(0xff, ccl_simplesnappy.FRAME_MAGIC),
+            make_frame(0x00, b"\x01\x02\x03\x04" + compressed),
+            make_frame(0x01, b"\x01\x02\x03\x04uncompressed"),
+            make_frame(0xfe, b""),
+            make_frame(0x80, bytes(rng.getrandbits(8) for _ in range(70000))),
+        ))
+
+    def test_iter_frames_matches_read_frame(self):
+        expected = read_all_frames(BytesIO(self.stream))
+        self.assertEqual(len(expected), 5)
+        actual = [(frame_id, bytes(data)) for frame_id, data in ccl_simplesnappy.iter_frames(BytesIO(self.stream))]
+        self.assertEqual(actual, expected)
+
+    def test_empty_stream(self):
+        self.assertEqual(read_all_frames(BytesIO(b"")), [])
+        self.assertEqual(list(ccl_simplesnappy.iter_frames(BytesIO(b""))), [])
+
+    def test_truncated(self):
+        last_frame_start = self.stream.rindex(make_frame(0xfe, b"")) + 4
+        for name, length in (("header", last_frame_start + 2), ("payload", len(self.stream) - 1)):
+            truncated = self.stream[:length]
+            with self.subTest(truncated=name, reader="read_frame"):
+                with self.assertRaises(ValueError):
+                    read_all_frames(BytesIO(truncated))
+            with self.subTest(truncated=name, reader="iter_frames"):
+                with self.assertRaises(ValueError):
+                    list(ccl_simplesnappy.iter_frames(BytesIO(truncated)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Checks that the three ways of testing a KeySearch in ccl.common (is_keysearch_hit directly, through
+compile_keysearch, and through make_matcher) agree for every supported kind of search.
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import re
+import unittest
+
+from ccl import common
+
+
+class StrSubclass(str):
+    ...
+
+
+class CallableList(list):
+    """A collection that is also callable: is_keysearch_hit calls it rather than testing membership"""
+    def __call__(self, value):
+        return value.startswith("x")
+
+
+STR_VALUES = ("abc", "ab", "abcd", "def", "xyz", "ABC", "")
+NON_STR_VALUES = (1, None, b"abc")
+
+SEARCHES = {
+    "str": "abc",
+    "str subclass": StrSubclass("abc"),
+    "pattern": re.compile("^ab"),
+    "set": {"abc", "def"},
+    "frozenset": frozenset(("abc", "def")),
+    "list": ["abc", "def"],
+    "tuple": ("abc", "def"),
+    "dict": {"abc": 1, "def": 2},
+    "callable": lambda value: value.endswith("c"),
+    "callable list": CallableList(["abc"]),
+}
+
+# searches that can be given values of any type, rather than only strings
+NON_STR_SEARCHES = ("str", "str subclass", "set", "frozenset", "list", "tuple", "dict")
+
+
+class TestKeySearch(unittest.TestCase):
+    def assert_agree(self, search, value):
+        expected = common.is_keysearch_hit(search, value)
+        self.assertIsInstance(expected, bool)
+        self.assertIs(common.is_keysearch_hit(common.compile_keysearch(search), value), expected)
+        self.assertIs(common.make_matcher(search)(value), expected)
+        return expected
+
+    def test_str_values(self):
+        for name, search in SEARCHES.items():
+            hits = set()
+            for value in STR_VALUES:
+                with self.subTest(search=name, value=value):
+                    if self.assert_agree(search, value):
+                        hits.add(value)
+            with self.subTest(search=name):
+                self.assertTrue(hits, "expected at least one hit")
+                self.assertNotEqual(hits, set(STR_VALUES), "expected at least one miss")
+
+    def test_non_str_values(self):
+        for name in NON_STR_SEARCHES:
+            for value in NON_STR_VALUES:
+                with self.subTest(search=name, value=value):
+                    self.assertFalse(self.assert_agree(SEARCHES[name], value))
+
+    def test_callable_collection_is_called(self):
+        search = SEARCHES["callable list"]
+        self.assertTrue(self.assert_agree(search, "xyz"))
+        self.assertFalse(self.assert_agree(search, "abc"))
+
+    def test_unexpected_types(self):
+        for search in (1, None, object()):
+            with self.subTest(search=search):
+                with self.assertRaises(TypeError):
+                    common.is_keysearch_hit(search, "abc")
+                with self.assertRaises(TypeError):
+                    common.is_keysearch_hit(common.compile_keysearch(search), "abc")
+                with self.assertRaises(TypeError):
+                    common.make_matcher(search)
+
+
+if __name__ == "__main__":
+    unittest.main()